@@ -3,10 +3,22 @@
 
 Created: 2020-09-23
 """
+from math import comb
+
 import numpy as np
 import scipy as sp
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.linalg import cholesky_banded, cho_solve_banded
 from scipy.sparse import diags as band
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to the plain function
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 
 class Conv1D:
 
@@ -23,14 +35,35 @@ class Conv1D:
         first_row = np.r_[kernel[0], padding]
         return sp.linalg.toeplitz(first_col, first_row)
 
+    @staticmethod
+    def get_square_conv_matrix(signal, kernel):
+        """
+        Construct the first n rows of the convolution matrix directly.
+
+        Equivalent to get_conv_matrix(signal, kernel)[:n, ] without
+        allocating the extra m-1 rows that are immediately discarded.
+        """
+        n = signal.shape[0]
+        first_col = np.zeros(n)
+        first_col[:min(kernel.shape[0], n)] = kernel[:n]
+        first_row = np.zeros(n)
+        first_row[0] = kernel[0]
+        return sp.linalg.toeplitz(first_col, first_row)
+
     @staticmethod
     def freq_conv(signal, kernel):
-        """1D convolution in the frequency domain"""
+        """
+        1D convolution in the frequency domain.
+
+        Real transforms are taken at a fast composite length rather
+        than n+m-1, which can be a poorly factorisable FFT size.
+        """
         n = signal.shape[0]
         m = kernel.shape[0]
-        signal_freq = np.fft.fft(signal, n + m - 1)
-        kernel_freq = np.fft.fft(kernel, n + m - 1)
-        return np.fft.ifft(signal_freq * kernel_freq).real
+        size = next_fast_len(n + m - 1, real=True)
+        signal_freq = rfft(signal, size)
+        kernel_freq = rfft(kernel, size)
+        return irfft(signal_freq * kernel_freq, size)[:n + m - 1]
 
     @staticmethod
     def freq_deconv(signal, kernel):
@@ -47,6 +80,35 @@ def soft_thresh(x, lam):
     return np.sign(x) * np.maximum(np.abs(x) - lam, 0)
 
 
+@njit(cache=True, fastmath=True)
+def _admm_dual_update(x_k, alpha, u, beta, work, thresh, p):
+    """
+    Fused Dx / soft-threshold / dual update for one ADMM iteration.
+
+    Computes the order-p difference of x_k in place in the work buffer,
+    then soft-thresholds and updates the dual in a single scalar pass,
+    so the whole step makes one trip through memory.
+    """
+    n = x_k.shape[0]
+    for i in range(n):
+        work[i] = x_k[i]
+    length = n
+    for _ in range(p):
+        for i in range(length - 1):
+            work[i] = work[i + 1] - work[i]
+        length -= 1
+    for i in range(length):
+        v = work[i] + u[i]
+        a = abs(v) - thresh
+        if a < 0.0:
+            a = 0.0
+        if v < 0.0:
+            a = -a
+        alpha[i] = a
+        u[i] = v - a
+        beta[i] = a - u[i]
+
+
 def admm_deconvolution(y, kernel, lam, rho, n_iters=100, k=0):
     """
     Solves the following optimization problem via ADMM
@@ -56,28 +118,45 @@ def admm_deconvolution(y, kernel, lam, rho, n_iters=100, k=0):
 
     where C is the discrete convolution matrix, and D the
     discrete differences matrix.
+
+    C is banded with bandwidth m, so it is kept in sparse storage
+    rather than materialized as a dense Toeplitz matrix; C'C is
+    assembled from the sparse bands and C'y is a single correlation
+    computed in the frequency domain.
     """
     n = y.shape[0]
     m = kernel.shape[0]
-    C = Conv1D.get_conv_matrix(y, kernel)[:n, ]
-    D = band([-1, 1], [0, 1], shape=(n - 1, n)).toarray()
-    D = np.diff(D, n=k, axis=0)
+    p = k + 1
+
+    # the order-p difference D is convolution with a short stencil, so
+    # Dx is np.diff and D'v is a full convolution with the stencil
+    stencil = np.array([(-1.0) ** (p - j) * comb(p, j) for j in range(p + 1)])
+    C = band(kernel, -np.arange(m), shape=(n, n)).tocsc()
+    D = band(stencil, np.arange(p + 1), shape=(n - p, n)).tocsc()
+
     # pre-calculations
-    DtD = D.T @ D
-    CtC = C.T @ C / n
-    Cty = C.T @ y / n
-    x_update_1 = np.linalg.inv(CtC + rho * DtD)
+    A = (C.T @ C) / n + rho * (D.T @ D)
+    Cty = Conv1D.freq_conv(y, kernel[::-1])[m - 1:m - 1 + n] / n
+
+    # A is SPD and banded, so factor it once with a banded Cholesky;
+    # each iteration then costs O(n*bw) instead of O(n^2)
+    bw = max(m - 1, p)
+    A_band = np.zeros((bw + 1, n))
+    for i in range(bw + 1):
+        A_band[bw - i, i:] = A.diagonal(i)
+    chol = cholesky_banded(A_band)
 
     x_k = None
-    alpha_0 = np.zeros(n - k - 1)
-    u_0 = np.zeros(n - k - 1)
+    alpha_k = np.zeros(n - p)
+    u_k = np.zeros(n - p)
+    beta = np.zeros(n - p)  # alpha - u, the only combination the x-update reads
+    work = np.empty(n)
+    thresh = lam / rho
     for t in range(n_iters):
-        x_k = x_update_1 @ (Cty + rho * D.T @ (alpha_0 - u_0))
-        alpha_k = soft_thresh(D @ x_k + u_0, lam / rho)
-        u_k = u_0 + D @ x_k - alpha_k
-
-        alpha_0 = alpha_k
-        u_0 = u_k
+        x_k = cho_solve_banded(
+            (chol, False),
+            Cty + rho * np.convolve(beta, stencil, mode="full"))
+        _admm_dual_update(x_k, alpha_k, u_k, beta, work, thresh, p)
 
     return x_k
 
@@ -94,7 +173,7 @@ def admm_deconvolution_v2(y, kernel, lam, rho, n_iters=100, k=0):
     """
     n = y.shape[0]
     m = kernel.shape[0]
-    C = Conv1D.get_conv_matrix(y, kernel)[:n, ]
+    C = Conv1D.get_square_conv_matrix(y, kernel)
     D = band([-1, 1], [0, 1], shape=(n - 1, n)).toarray()
     D = np.diff(D, n=k, axis=0)
     I = np.eye(n)
@@ -66,7 +66,7 @@ class InfectionCurve:
         difference operator of order k+1.
         """
         n = y.shape[0]
-        W = Conv1D.get_conv_matrix(y, self.delay)[:n, ]
+        W = Conv1D.get_square_conv_matrix(y, self.delay)
         r_y = robjects.FloatVector(np.linalg.inv(W) @ y)
         mod = genlasso.trendfilter(r_y, ord=k)
         r_pred = rlist2dict(self.tf_predict(mod, n_folds))['preds']
@@ -0,0 +1,91 @@
+"""Cache indicator data in local parquet panels."""
+
+import os
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from .epidata import LocationSeries
+
+
+def _panel_path(cache_dir: str, source: str, signal: str) -> str:
+    """Build the panel file path for one (source, signal)."""
+    return os.path.join(cache_dir, f"{source}_{signal}.parquet")
+
+
+def save_indicator_panel(indicator_data: Dict[Tuple, Dict[Tuple,
+                                                          LocationSeries]],
+                         cache_dir: str) -> List[str]:
+    """
+    Persist fetched indicator data as one parquet panel per sensor.
+
+    Each (source, signal) becomes a single columnar (time_value,
+    geo_type, geo_value, value) table, so later runs can reload it
+    with one contiguous disk read instead of re-fetching from the API.
+
+    Parameters
+    ----------
+    indicator_data
+        Nested dict of indicator data, as returned by
+        get_indicator_data.
+    cache_dir
+        Directory to write the panels under.
+
+    Returns
+    -------
+        List of paths written.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = []
+    for (source, signal), bucket in indicator_data.items():
+        frames = [pd.DataFrame({"time_value": series.dates,
+                                "geo_type": geo_type,
+                                "geo_value": geo_value,
+                                "value": series.values})
+                  for (geo_type, geo_value), series in bucket.items()]
+        path = _panel_path(cache_dir, source, signal)
+        pd.concat(frames, ignore_index=True).to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def load_indicator_panel(sensors: List[Tuple[str, str]],
+                         cache_dir: str,
+                         geo_values: List[str] = None
+                         ) -> Dict[Tuple, Dict[Tuple, LocationSeries]]:
+    """
+    Load cached indicator data, sliced with parquet-level filters.
+
+    The location filter is pushed down into the parquet reader, so
+    only the requested rows are materialized rather than the whole
+    panel.
+
+    Parameters
+    ----------
+    sensors
+        List of (source, signal) tuples specifying indicators to load.
+    cache_dir
+        Directory the panels were written under.
+    geo_values
+        Locations to load; all cached locations if not given.
+
+    Returns
+    -------
+        Nested dict in the shape returned by get_indicator_data,
+        covering the sensors with a cached panel.
+    """
+    filters = [("geo_value", "in", geo_values)] if geo_values else None
+    output = {}
+    for source, signal in sensors:
+        path = _panel_path(cache_dir, source, signal)
+        if not os.path.exists(path):
+            continue
+        panel = pd.read_parquet(path, filters=filters)
+        bucket = {}
+        for (geo_type, geo_value), group in panel.groupby(
+                ["geo_type", "geo_value"]):
+            bucket[(geo_type, geo_value)] = LocationSeries(
+                geo_value, geo_type, group["time_value"].to_numpy(),
+                group["value"].to_numpy())
+        output[(source, signal)] = bucket
+    return output
@@ -1,28 +1,71 @@
 """Estimate the covariance matrix."""
 
-from typing import List, Tuple
+from typing import List
 
 import numpy as np
 
+from .epidata import LocationSeries
+
+
+def _blend_diagonal(cov: np.ndarray, weight: float = 0.5) -> np.ndarray:
+    """
+    Shrink an empirical covariance toward its diagonal.
+
+    Short or poorly overlapping histories make the off-diagonal
+    estimates noisy and can break positive definiteness; blending with
+    the diagonal keeps the matrix usable as a noise covariance.
+
+    Parameters
+    ----------
+    cov
+        Empirical covariance matrix.
+    weight
+        Weight on the diagonal part, between 0 and 1.
+
+    Returns
+    -------
+        Blended covariance matrix.
+    """
+    return weight * np.diag(np.diag(cov)) + (1 - weight) * cov
+
+
 def estimate_covariance(input_dates: List[int],
-                        sensors: List[Tuple],
-                        ground_truth_values: np.ndarray):
+                        sensors: List[LocationSeries],
+                        ground_truth_values: np.ndarray) -> np.ndarray:
     """
     Estimate the sensor noise covariance matrix R.
 
+    Each sensor's residuals against the ground truth at its own
+    location are aligned on the input dates, the covariance is taken
+    over the dates where sensors overlap, and the result is shrunk
+    toward its diagonal.
 
     Parameters
     ----------
     input_dates
-
+        List of dates the sensors were trained on.
     sensors
+        List of sensor LocationSeries, one per fused sensor reading.
     ground_truth_values
+        Matrix of ground truth values, one row per sensor aligned with
+        input_dates.
 
     Returns
     -------
-
+        Noise covariance matrix of dimension # sensors X # sensors.
     """
-    # basically wrap https://github.com/dfarrow0/covidcast-nowcast/blob/0de33880368eac3df6c1ac7b2d4ba6a41ff85480/src/sf/nowcast.py#L239-L252
-    # R = covariance.mle_cov(noise, covariance.BlendDiagonal2)
-    # return R
-    pass
+    date_index = {date: i for i, date in enumerate(input_dates)}
+    noise = np.full((len(input_dates), len(sensors)), np.nan)
+    for j, series in enumerate(sensors):
+        for date, value in zip(series.dates, series.values):
+            i = date_index.get(date)
+            if i is not None:
+                noise[i, j] = value - ground_truth_values[j, i]
+    masked = np.ma.masked_invalid(noise)
+    cov = np.atleast_2d(np.ma.cov(masked, rowvar=False).filled(0.0))
+    # sensors with too few residuals get the average variance rather
+    # than a singular zero entry
+    diag = np.diag(cov)
+    fallback = diag[diag > 0].mean() if (diag > 0).any() else 1.0
+    np.fill_diagonal(cov, np.where(diag > 0, diag, fallback))
+    return _blend_diagonal(cov)
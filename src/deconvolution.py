@@ -1,8 +1,16 @@
 """Generate ground truth signal."""
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from math import comb
 from typing import List, Tuple
 
 import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft, set_workers
+from scipy.linalg import cholesky_banded, cho_solve_banded
+from scipy.sparse import diags
+
+from .epidata import get_signal_range
 
 def deconv_signal(ground_truth_indicator: Tuple[str, str],
                   input_dates: List[int],
@@ -29,31 +37,409 @@ def deconv_signal(ground_truth_indicator: Tuple[str, str],
     -------
         Matrix of ground truth values for each location.
     """
-    # num_locs = len(input_locations)
-    # num_dates = len(input_dates)
-    # deconv_infections = np.full((num_locs, num_dates), np.nan)
-    # for each input_location i:
-    #     raw_cases = Epidata.covidcast(source, signal...)
-    #     deconv_infections[i, :] = DeconvADMM.fit_cv(raw_cases, kernel, ...)
-    # return deconv_infections
-    pass
-
-def fit(signal, # TODO
-        kernel: np.array,
-        k: int,
-        max_iters: int
-        ):  # TODO return type
-    # ADMM code (already completed)
-    pass
-
-
-def fit_cv(signal,  # TODO np.ndarray?
-           kernel: np.array,
-           k: int,
-           max_iters: int,
-           cv_grid  # TODO list?
-           ):  # TODO return type
-    # for param in cv_grid:
-    #     est = DeconvADMM.fit(signal[train_inds], kernel)
-    #     loss = mae(predict(est), signal[test_inds])
-    # pass
\ No newline at end of file
+    source, signal = ground_truth_indicator
+    start_date, end_date = min(input_dates), max(input_dates)
+    kernel = np.asarray(kernel, dtype=np.float64)
+    num_locs = len(input_locations)
+    num_dates = len(input_dates)
+
+    # fire all API requests concurrently; each worker just blocks on HTTP,
+    # so total fetch time is bounded by the slowest response, not the sum
+    with ThreadPoolExecutor(max_workers=min(32, num_locs)) as executor:
+        all_series = list(executor.map(
+            lambda loc: get_signal_range(source, signal, start_date,
+                                         end_date, loc[1], loc[0]),
+            input_locations))
+
+    date_index = {date: i for i, date in enumerate(input_dates)}
+    observed = np.full((num_locs, num_dates), np.nan)
+    fit_rows = []
+    for i, series in enumerate(all_series):
+        if series is None:
+            continue
+        for date, value in zip(series.dates, series.values):
+            idx = date_index.get(date)
+            if idx is not None:
+                observed[i, idx] = value
+        fit_rows.append(i)
+
+    # each location's deconvolution is CPU-bound and independent, so
+    # fan the ADMM fits out across cores
+    deconv_infections = np.full((num_locs, num_dates), np.nan)
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(partial(fit_cv, kernel=kernel),
+                               (observed[i] for i in fit_rows))
+        for i, deconvolved in zip(fit_rows, results):
+            deconv_infections[i, :] = deconvolved
+    return deconv_infections
+
+def wiener_deconv(signals: np.ndarray,
+                  kernel: np.ndarray,
+                  eta: float = 1.0) -> np.ndarray:
+    """
+    Deconvolve signals with a regularized frequency-domain divide.
+
+    The DFT diagonalizes the (circulant approximation of the)
+    convolution operator, so the inverse is an elementwise divide
+    damped by eta. All locations are transformed in one batched,
+    multithreaded pass, making this orders of magnitude cheaper than
+    the ADMM fit — at the cost of no trend filtering penalty — and a
+    good fast first estimate. NaNs should be imputed beforehand.
+
+    Parameters
+    ----------
+    signals
+        Signal to deconvolve, or a stack of signals in rows.
+    kernel
+        Delay distribution from infection to report.
+    eta
+        Tikhonov regularization weight damping frequencies the kernel
+        barely passes.
+
+    Returns
+    -------
+        Deconvolved estimates with the same shape as signals.
+    """
+    stacked = np.atleast_2d(signals)
+    n = stacked.shape[-1]
+    size = next_fast_len(n + kernel.shape[0] - 1, real=True)
+    kernel_freq = _kernel_fft(tuple(kernel.tolist()), size)
+    with set_workers(-1):
+        signal_freq = rfft(stacked, size, axis=-1)
+        out = irfft(np.conj(kernel_freq) * signal_freq
+                    / (np.abs(kernel_freq) ** 2 + eta), size, axis=-1)
+    out = out[..., :n]
+    return out[0] if signals.ndim == 1 else out
+
+
+@lru_cache(maxsize=32)
+def _kernel_fft(kernel_key: Tuple,
+                size: int,
+                dtype: np.dtype = np.float64) -> np.ndarray:
+    """
+    Compute the rfft of a kernel once per (kernel, FFT length).
+
+    The delay kernel is a fixed artifact reused across every location
+    and every run of the day's job, so its transform is memoized;
+    worker processes are reused across locations and hit the cache
+    after their first fit. Callers must not modify the returned array.
+
+    Parameters
+    ----------
+    kernel_key
+        Kernel values as a (hashable) tuple.
+    size
+        FFT length, from next_fast_len.
+    dtype
+        Float dtype to transform in.
+
+    Returns
+    -------
+        rfft of the kernel, zero-padded to size.
+    """
+    return rfft(np.asarray(kernel_key, dtype=dtype), size)
+
+
+def _impute_with_neighbors(signal: np.ndarray) -> np.ndarray:
+    """
+    Fill missing values with the average of their neighbors.
+
+    Interior NaNs become the mean of the two adjacent values and boundary
+    NaNs copy their single neighbor. The fill is computed with shifted
+    views rather than a Python loop over elements.
+
+    Parameters
+    ----------
+    signal
+        Signal values, possibly containing NaNs.
+
+    Returns
+    -------
+        Copy of the signal with NaNs imputed.
+    """
+    imputed = np.array(signal, dtype=np.float64)
+    mask = np.isnan(imputed[1:-1])
+    imputed[1:-1][mask] = 0.5 * (imputed[:-2][mask] + imputed[2:][mask])
+    if np.isnan(imputed[0]):
+        imputed[0] = imputed[1]
+    if np.isnan(imputed[-1]):
+        imputed[-1] = imputed[-2]
+    return imputed
+
+
+def _freq_conv(signal: np.ndarray,
+               kernel_freq: np.ndarray,
+               size: int,
+               n_out: int) -> np.ndarray:
+    """
+    Convolve a signal against a kernel whose FFT is precomputed.
+
+    Parameters
+    ----------
+    signal
+        Signal to convolve, or a stack of signals in rows.
+    kernel_freq
+        rfft of the kernel, zero-padded to size.
+    size
+        FFT length, from next_fast_len.
+    n_out
+        Number of leading output values to keep.
+
+    Returns
+    -------
+        First n_out values of the linear convolution, per row.
+    """
+    signal_freq = rfft(signal, size, axis=-1)
+    return irfft(signal_freq * kernel_freq, size, axis=-1)[..., :n_out]
+
+
+def _precompute(y: np.ndarray,
+                kernel: np.ndarray,
+                rho: float,
+                k: int) -> Tuple:
+    """
+    Compute the quantities shared by every ADMM solve on a signal.
+
+    The banded system CtC/n + rho*DtD does not depend on the
+    regularization weight, so its Cholesky factor (along with C'y and
+    the difference stencil) can be reused across an entire lambda grid.
+
+    Parameters
+    ----------
+    y
+        Signal to deconvolve.
+    kernel
+        Delay distribution to deconvolve with.
+    rho
+        ADMM augmented Lagrangian parameter.
+    k
+        Degree of the trend filtering penalty.
+
+    Returns
+    -------
+        Tuple of (banded Cholesky factor, C'y/n, difference stencil, k+1).
+    """
+    n = y.shape[0]
+    m = kernel.shape[0]
+    p = k + 1
+    stencil = np.array([(-1.0) ** (p - j) * comb(p, j) for j in range(p + 1)],
+                       dtype=y.dtype)
+    C = diags(kernel.astype(y.dtype), -np.arange(m), shape=(n, n)).tocsc()
+    D = diags(stencil, np.arange(p + 1), shape=(n - p, n)).tocsc()
+    A = (C.T @ C) / n + rho * (D.T @ D)
+    bw = max(m - 1, p)
+    A_band = np.zeros((bw + 1, n), dtype=y.dtype)
+    for i in range(bw + 1):
+        A_band[bw - i, i:] = A.diagonal(i)
+    return cholesky_banded(A_band), C.T @ y / n, stencil, p
+
+
+def _fit_admm(precomp: Tuple,
+              lam: float,
+              rho: float,
+              max_iters: int,
+              alpha_0: np.ndarray = None,
+              u_0: np.ndarray = None,
+              tol: float = 1e-4
+              ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Run the ADMM iterations, optionally warm-started from (alpha, u).
+
+    Parameters
+    ----------
+    precomp
+        Output of _precompute for the signal being fit.
+    lam
+        Trend filtering penalty weight.
+    rho
+        ADMM augmented Lagrangian parameter.
+    max_iters
+        Maximum number of ADMM iterations to run.
+    alpha_0
+        Initial auxiliary variable, e.g. from a neighboring lambda.
+    u_0
+        Initial scaled dual variable.
+    tol
+        Relative change in the estimate below which iteration stops;
+        warm starts typically terminate in a handful of iterations.
+
+    Returns
+    -------
+        Tuple of (estimate, alpha, u) so callers can chain warm starts.
+    """
+    chol, Cty, stencil, p = precomp
+    n = Cty.shape[0]
+    # a NumPy float64 scalar would promote a float32 solve back to float64
+    lam = float(lam)
+    if alpha_0 is None:
+        alpha_0 = np.zeros(n - p, dtype=Cty.dtype)
+    if u_0 is None:
+        u_0 = np.zeros(n - p, dtype=Cty.dtype)
+    x_k = x_prev = None
+    for _ in range(max_iters):
+        x_k = cho_solve_banded(
+            (chol, False),
+            Cty + rho * np.convolve(alpha_0 - u_0, stencil, mode="full"))
+        Dx_k = np.diff(x_k, n=p)
+        alpha_0 = np.sign(Dx_k + u_0) * np.maximum(
+            np.abs(Dx_k + u_0) - lam / rho, 0)
+        u_0 = u_0 + Dx_k - alpha_0
+        if x_prev is not None and \
+                np.linalg.norm(x_k - x_prev) <= tol * np.linalg.norm(x_prev):
+            break
+        x_prev = x_k
+    return x_k, alpha_0, u_0
+
+
+def _fit_grid(y: np.ndarray,
+              kernel: np.ndarray,
+              cv_grid: np.ndarray,
+              rho: float,
+              k: int,
+              max_iters: int) -> np.ndarray:
+    """
+    Fit every penalty weight in a grid on one signal.
+
+    The banded factorization and C'y are computed once and shared by
+    the whole grid, which is swept from most to least regularized so
+    each solve warm-starts from its neighbor.
+
+    Parameters
+    ----------
+    y
+        Signal to deconvolve, with NaNs already imputed.
+    kernel
+        Delay distribution to deconvolve with.
+    cv_grid
+        Grid of penalty weights to fit.
+    rho
+        ADMM augmented Lagrangian parameter.
+    k
+        Degree of the trend filtering penalty.
+    max_iters
+        Maximum number of ADMM iterations per fit.
+
+    Returns
+    -------
+        Matrix of estimates, one row per grid entry in grid order.
+    """
+    precomp = _precompute(y, kernel, rho, k)
+    x_hat = np.empty((cv_grid.shape[0], y.shape[0]), dtype=y.dtype)
+    alpha_0 = u_0 = None
+    for j in np.argsort(cv_grid)[::-1]:
+        x_hat[j], alpha_0, u_0 = _fit_admm(precomp, cv_grid[j], rho,
+                                           max_iters, alpha_0, u_0)
+    return x_hat
+
+
+def fit(signal: np.ndarray,
+        kernel: np.ndarray,
+        lam: float,
+        k: int = 2,
+        max_iters: int = 200,
+        rho: float = 1.0,
+        dtype: np.dtype = np.float64) -> np.ndarray:
+    """
+    Deconvolve a signal with a trend filtering penalty via ADMM.
+
+    Solves
+
+        minimize  (1/2n) ||y - Cx||_2^2 + lam ||D^(k+1) x||_1
+            x
+
+    where C is the convolution matrix of the kernel and D^(k+1) is the
+    discrete difference operator of order k+1.
+
+    Parameters
+    ----------
+    signal
+        Signal to deconvolve, possibly containing NaNs.
+    kernel
+        Delay distribution from infection to report.
+    lam
+        Trend filtering penalty weight.
+    k
+        Degree of the trend filtering penalty.
+    max_iters
+        Number of ADMM iterations to run.
+    rho
+        ADMM augmented Lagrangian parameter.
+    dtype
+        Float dtype to solve in; float32 halves memory traffic and is
+        plenty of precision for count-scale signals.
+
+    Returns
+    -------
+        Deconvolved signal estimate.
+    """
+    y = _impute_with_neighbors(signal).astype(dtype, copy=False)
+    kernel = np.asarray(kernel, dtype=dtype)
+    x_hat, _, _ = _fit_admm(_precompute(y, kernel, rho, k), lam, rho, max_iters)
+    return x_hat
+
+
+def fit_cv(signal: np.ndarray,
+           kernel: np.ndarray,
+           k: int = 2,
+           max_iters: int = 200,
+           rho: float = 1.0,
+           cv_grid: np.ndarray = None,
+           n_folds: int = 3,
+           dtype: np.dtype = np.float64) -> np.ndarray:
+    """
+    Deconvolve with the penalty weight chosen by forward validation.
+
+    Each fold holds out the last i observations, fits on the rest for
+    every lam in the grid, and scores the reconvolved prediction at the
+    held-out dates. The banded system does not depend on lam, so it is
+    factored once per fold and reused across the grid, with ADMM
+    warm-started from the neighboring lam's iterates.
+
+    Parameters
+    ----------
+    signal
+        Signal to deconvolve, possibly containing NaNs.
+    kernel
+        Delay distribution from infection to report.
+    k
+        Degree of the trend filtering penalty.
+    max_iters
+        Number of ADMM iterations to run per fit.
+    rho
+        ADMM augmented Lagrangian parameter.
+    cv_grid
+        Grid of penalty weights to search over.
+    n_folds
+        Number of forward validation folds.
+    dtype
+        Float dtype to solve in; float32 halves memory traffic and is
+        plenty of precision for count-scale signals.
+
+    Returns
+    -------
+        Deconvolved signal estimate fit with the chosen penalty weight.
+    """
+    if cv_grid is None:
+        cv_grid = np.logspace(1, 3.5, 10)
+    y = _impute_with_neighbors(signal).astype(dtype, copy=False)
+    kernel = np.asarray(kernel, dtype=dtype)
+    n = y.shape[0]
+
+    # the kernel FFT is identical for every fold, lambda, and location
+    # handled by this worker, so it comes from the memoized transform
+    size = next_fast_len(n + kernel.shape[0] - 1, real=True)
+    kernel_freq = _kernel_fft(tuple(kernel.tolist()), size, kernel.dtype.type)
+
+    cv_loss = np.zeros(cv_grid.shape[0])
+    for i in range(1, n_folds + 1):
+        x_hat = _fit_grid(y[:-i], kernel, cv_grid, rho, k, max_iters)
+        x_ext = np.empty((cv_grid.shape[0], n), dtype=dtype)
+        x_ext[:, :n - i] = x_hat
+        x_ext[:, n - i:] = x_hat[:, -1:]
+        # score every lambda's reconvolution with one batched transform
+        y_hat = _freq_conv(x_ext, kernel_freq, size, n)
+        cv_loss += np.abs(y[-i:] - y_hat[:, -i:]).mean(axis=1)
+    lam_star = cv_grid[np.argmin(cv_loss)]
+    x_hat, _, _ = _fit_admm(_precompute(y, kernel, rho, k), lam_star, rho,
+                            max_iters)
+    return x_hat
\ No newline at end of file
@@ -0,0 +1,328 @@
+"""Fetch data from the Epidata API."""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+import requests
+from delphi_epidata import Epidata
+from pandas import date_range
+
+# first day of data to request when training sensors
+EPIDATA_START_DATE = 20200101
+
+
+class _NowcastEpidata(Epidata):
+    """
+    Epidata client for the sensor database.
+
+    Carries its own BASE_URL, pointed elsewhere when the sensor
+    database lives on a different server. The upstream endpoint
+    methods are staticmethods that read Epidata.BASE_URL directly and
+    would silently ignore the subclass attribute, so the query is
+    built and issued here against cls.BASE_URL rather than delegated
+    upstream; no shared state is touched, and Epidata calls running
+    concurrently on other threads keep hitting the main server.
+    """
+
+    BASE_URL = Epidata.BASE_URL
+
+    @classmethod
+    def covidcast_nowcast(cls,
+                          data_source: str,
+                          signals: str,
+                          time_type: str,
+                          geo_type: str,
+                          time_values,
+                          geo_value: str) -> Dict:
+        """Query the covidcast_nowcast endpoint at cls.BASE_URL."""
+        params = {
+            "source": "covidcast_nowcast",
+            "data_source": data_source,
+            "signals": Epidata._list(signals),
+            "time_type": time_type,
+            "geo_type": geo_type,
+            "time_values": Epidata._list(time_values),
+            "geo_value": geo_value,
+        }
+        try:
+            response = requests.get(cls.BASE_URL, params=params)
+            response.raise_for_status()
+            return response.json()
+        except Exception as exception:
+            # same failure shape as the upstream client, so callers
+            # can keep checking result/message uniformly
+            return {"result": 0, "message": f"error: {exception}"}
+
+
+@dataclass
+class LocationSeries:
+    """
+    Time series of signal values for a single location.
+
+    Dates and values are held as parallel NumPy arrays so the hot
+    paths can mask, merge, and searchsort them without per-element
+    Python dispatch; list inputs are coerced on construction.
+    """
+
+    geo_value: str = None
+    geo_type: str = None
+    dates: np.ndarray = field(default_factory=lambda: np.empty(0, np.int64))
+    values: np.ndarray = field(default_factory=lambda: np.empty(0, np.float64))
+
+    def __post_init__(self):
+        self.dates = np.asarray(self.dates, dtype=np.int64)
+        self.values = np.asarray(self.values, dtype=np.float64)
+
+    def add_data(self, date: int, value: float):
+        """Append a date and value to the series."""
+        self.dates = np.append(self.dates, date)
+        self.values = np.append(self.values, value)
+
+
+@lru_cache(maxsize=4096)
+def lag_date(date: int, lag: int) -> int:
+    """
+    Shift a date backward by a number of days.
+
+    Decomposes the YYYYMMDD int directly instead of round-tripping
+    through strptime/strftime, and memoizes since the same (date, lag)
+    pairs recur across locations.
+
+    Parameters
+    ----------
+    date
+        Date to shift, as a YYYYMMDD int.
+    lag
+        Number of days to shift backward; negative shifts forward.
+
+    Returns
+    -------
+        Shifted date as a YYYYMMDD int.
+    """
+    shifted = datetime(date // 10000, date // 100 % 100, date % 100) \
+        - timedelta(days=lag)
+    return shifted.year * 10000 + shifted.month * 100 + shifted.day
+
+
+def dates_in_range(start_date: int, end_date: int) -> List[int]:
+    """
+    List every day between start_date and end_date, inclusive.
+
+    Formatting happens vectorized on the DatetimeIndex instead of via
+    per-element strftime calls in a Python loop.
+
+    Parameters
+    ----------
+    start_date
+        First day, as a YYYYMMDD int.
+    end_date
+        Last day, as a YYYYMMDD int.
+
+    Returns
+    -------
+        List of YYYYMMDD ints.
+    """
+    days = date_range(str(start_date), str(end_date))
+    return days.strftime("%Y%m%d").astype(np.int64).tolist()
+
+
+def get_signal_range(source: str,
+                     signal: str,
+                     start_date: int,
+                     end_date: int,
+                     geo_type: str,
+                     geo_value: str) -> LocationSeries:
+    """
+    Get a date-sorted series of values for a signal in one location.
+
+    The response rows are parsed straight into NumPy arrays and ordered
+    with a single argsort rather than building intermediate tuple lists
+    and sorting at the Python level.
+
+    Parameters
+    ----------
+    source
+        Source of the signal, e.g. usa-facts.
+    signal
+        Name of the signal, e.g. confirmed_incidence_num.
+    start_date
+        First day to get, as a YYYYMMDD int.
+    end_date
+        Last day to get, as a YYYYMMDD int.
+    geo_type
+        Geo type of the location, e.g. county.
+    geo_value
+        Location to get, e.g. a FIPS code.
+
+    Returns
+    -------
+        LocationSeries of the returned dates and values, or None if the
+        API did not return data.
+    """
+    response = Epidata.covidcast(source, signal, "day", geo_type,
+                                 Epidata.range(start_date, end_date),
+                                 geo_value)
+    if response["result"] != 1:
+        print(f"{source} {signal} not available for {geo_value} "
+              f"({response['message']})")
+        return None
+    epidata = response["epidata"]
+    dates = np.fromiter((row["time_value"] for row in epidata),
+                        dtype=np.int32, count=len(epidata))
+    values = np.fromiter(
+        (row["value"] if row["value"] is not None else np.nan
+         for row in epidata),
+        dtype=np.float64, count=len(epidata))
+    # responses normally arrive date-sorted; only pay for the reorder
+    # copies when they do not
+    if np.any(np.diff(dates) < 0):
+        order = np.argsort(dates, kind="stable")
+        dates = dates[order]
+        values = values[order]
+    return LocationSeries(geo_value, geo_type, dates, values)
+
+
+def get_indicator_data(sensors: List[Tuple[str, str]],
+                       locations: List[LocationSeries],
+                       as_of_date: int
+                       ) -> Dict[Tuple, Dict[Tuple, LocationSeries]]:
+    """
+    Get as-of indicator values for all given (sensor, location) pairs.
+
+    Dates and values are collected in one pass over each response, with
+    NaN rows dropped as they are seen, rather than traversing the
+    response once per output list. The output is nested by sensor then
+    location, so per-location lookups hash a 2-tuple against a small
+    dict instead of rebuilding a 4-tuple key each time.
+
+    Parameters
+    ----------
+    sensors
+        List of (source, signal) tuples specifying indicators to get.
+    locations
+        List of LocationSeries giving the locations to get.
+    as_of_date
+        Date that the data should be retrieved as of, as a YYYYMMDD int.
+
+    Returns
+    -------
+        Dict of (source, signal) to dict of (geo_type, geo_value) to
+        LocationSeries.
+    """
+    locations_by_type = defaultdict(list)
+    for location in locations:
+        locations_by_type[location.geo_type].append(location.geo_value)
+    output = defaultdict(dict)
+    for source, signal in sensors:
+        for geo_type, geo_values in locations_by_type.items():
+            # one batched request for all locations of this geo type,
+            # demultiplexed locally, instead of one round trip each
+            response = Epidata.covidcast(
+                source, signal, "day", geo_type,
+                Epidata.range(EPIDATA_START_DATE, as_of_date),
+                ",".join(geo_values), as_of=as_of_date)
+            if response["result"] != 1:
+                continue
+            buckets = defaultdict(lambda: ([], []))
+            for row in response["epidata"]:
+                value = row["value"]
+                if value == value:  # inline NaN check
+                    dates, values = buckets[row["geo_value"]]
+                    dates.append(row["time_value"])
+                    values.append(value)
+            for geo_value, (dates, values) in buckets.items():
+                output[(source, signal)][(geo_type, geo_value)] = \
+                    LocationSeries(geo_value, geo_type, dates, values)
+    return dict(output)
+
+
+def get_indicator_version_data(indicator: Tuple[str, str],
+                               geo_type: str,
+                               geo_value: str,
+                               end_date: int) -> List[Dict]:
+    """
+    Get every issued version of an indicator in a single query.
+
+    Lets callers rebuild the data as it looked on any past day locally,
+    instead of issuing one as_of query per day of interest.
+
+    Parameters
+    ----------
+    indicator
+        (source, signal) tuple specifying the indicator.
+    geo_type
+        Geo type of the location, e.g. county.
+    geo_value
+        Location to get, e.g. a FIPS code.
+    end_date
+        Last issue date of interest, as a YYYYMMDD int.
+
+    Returns
+    -------
+        Response rows sorted by issue date, possibly empty.
+    """
+    source, signal = indicator
+    response = Epidata.covidcast(
+        source, signal, "day", geo_type,
+        Epidata.range(EPIDATA_START_DATE, end_date), geo_value,
+        issues=Epidata.range(EPIDATA_START_DATE, end_date))
+    if response["result"] != 1:
+        return []
+    return sorted(response["epidata"], key=lambda row: row["issue"])
+
+
+def get_historical_sensor_data(sensor: Tuple[str, str],
+                               geo_type: str,
+                               geo_values: List[str],
+                               start_date: int,
+                               end_date: int
+                               ) -> Dict[str, Tuple[LocationSeries, List[int]]]:
+    """
+    Get previously computed sensor values and the dates still missing.
+
+    All locations are pulled in a single batched request and split
+    apart locally rather than one round trip per location.
+
+    Parameters
+    ----------
+    sensor
+        (source, signal) tuple specifying the sensor to get.
+    geo_type
+        Geo type of the locations, e.g. county.
+    geo_values
+        Locations to get, e.g. FIPS codes.
+    start_date
+        First day to get, as a YYYYMMDD int.
+    end_date
+        Last day to get, as a YYYYMMDD int.
+
+    Returns
+    -------
+        Dict of geo_value to (LocationSeries of available values, list
+        of missing dates).
+    """
+    source, signal = sensor
+    response = _NowcastEpidata.covidcast_nowcast(
+        source, signal, "day", geo_type,
+        Epidata.range(start_date, end_date), ",".join(geo_values))
+    buckets = defaultdict(lambda: ([], []))
+    if response["result"] == 1:
+        for row in response["epidata"]:
+            value = row["value"]
+            if value == value:  # inline NaN check
+                dates, values = buckets[row["geo_value"]]
+                dates.append(row["time_value"])
+                values.append(value)
+    all_dates = dates_in_range(start_date, end_date)
+    output = {}
+    for geo_value in geo_values:
+        dates, values = buckets[geo_value]
+        have = set(dates)
+        missing_dates = [day for day in all_dates if day not in have]
+        output[geo_value] = (LocationSeries(geo_value, geo_type,
+                                            dates, values), missing_dates)
+    return output
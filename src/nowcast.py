@@ -1,9 +1,385 @@
 """Run nowcast."""
 
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 import numpy as np
 
+from .covariance import estimate_covariance
+from .deconvolution import deconv_signal
+from .epidata import LocationSeries, lag_date
+from .sensors import generate_sensors
+from .statespace import generate_statespace
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to the plain function
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# variance added to a missing observation so it carries no weight
+MISSING_OBS_VARIANCE = 1e12
+
+
+@njit("f8[:, ::1](f8[:, ::1], f8[:, ::1])", cache=True, fastmath=True)
+def _solve_spd(S: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    Solve S X = B for symmetric positive definite S.
+
+    The innovation covariance is SPD by construction, so a Cholesky
+    factor plus two triangular substitutions does the job at roughly
+    half the cost of the general LU solve.
+
+    Parameters
+    ----------
+    S
+        Symmetric positive definite matrix.
+    B
+        Right hand sides, one per column.
+
+    Returns
+    -------
+        Solution with the same shape as B.
+    """
+    L = np.linalg.cholesky(S)
+    n, m = B.shape
+    X = B.copy()
+    for j in range(m):
+        # forward substitution, L Y = B
+        for i in range(n):
+            acc = X[i, j]
+            for k in range(i):
+                acc -= L[i, k] * X[k, j]
+            X[i, j] = acc / L[i, i]
+        # back substitution, L.T X = Y
+        for i in range(n - 1, -1, -1):
+            acc = X[i, j]
+            for k in range(i + 1, n):
+                acc -= L[k, i] * X[k, j]
+            X[i, j] = acc / L[i, i]
+    return X
+
+
+# the explicit signature compiles eagerly at import (served from the
+# on-disk cache after the first run) instead of paying the JIT cost on
+# the first nowcast of every scheduled invocation
+_KF_SIGNATURE = ("Tuple((f8[:, ::1], f8[:, :, ::1]))"
+                 "(f8[:, ::1], b1[:, ::1], f8[:, ::1], f8[:, ::1],"
+                 " f8[:, ::1], f8[:, ::1], f8[::1], f8[:, ::1], i8)")
+
+
+@njit(_KF_SIGNATURE, cache=True, fastmath=True)
+def _kf_filter(z: np.ndarray,
+               valid: np.ndarray,
+               H: np.ndarray,
+               F: np.ndarray,
+               Q: np.ndarray,
+               R: np.ndarray,
+               x0: np.ndarray,
+               P0: np.ndarray,
+               proj_rank: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run the Kalman filter predict/update recursion over all dates.
+
+    The whole recursion runs as one compiled loop over preallocated
+    float64 arrays. Missing observations keep the problem dimensions
+    fixed: their innovation is zeroed and their noise variance
+    inflated so they carry no weight in the update. When proj_rank is
+    positive the innovation is projected onto a tracked top eigenspace
+    of its covariance: the basis comes from one eigendecomposition at
+    the first date and is then carried forward with a single
+    warm-started subspace iteration per date, so each step costs
+    O(# sensors squared x proj_rank) plus a proj_rank-sized solve
+    instead of the # sensors cubed full update, at a small accuracy
+    cost.
+
+    Parameters
+    ----------
+    z
+        Observations, one row per date, NaNs replaced by zeros.
+    valid
+        Boolean mask of which observations are present, same shape.
+    H
+        Observation matrix, # sensors X state dimension.
+    F
+        State transition matrix.
+    Q
+        Process noise covariance.
+    R
+        Observation noise covariance.
+    x0
+        Initial state mean.
+    P0
+        Initial state covariance.
+    proj_rank
+        Rank of the innovation projection; 0 runs the full update.
+
+    Returns
+    -------
+        (filtered means, filtered covariances) across dates.
+    """
+    num_dates, num_obs = z.shape
+    dim = H.shape[1]
+    means = np.zeros((num_dates, dim))
+    covs = np.zeros((num_dates, dim, dim))
+    eye = np.eye(dim)
+    x = x0.copy()
+    P = P0.copy()
+    proj_basis = np.zeros((num_obs, proj_rank))
+    # the transition has no cross-coordinate coupling for a random
+    # walk, so the predict step can scale P elementwise instead of
+    # paying two dense matmuls per date
+    F_is_diagonal = True
+    for i in range(dim):
+        for j in range(dim):
+            if i != j and F[i, j] != 0.0:
+                F_is_diagonal = False
+    for t in range(num_dates):
+        if F_is_diagonal:
+            for i in range(dim):
+                x[i] = F[i, i] * x[i]
+            for i in range(dim):
+                for j in range(dim):
+                    P[i, j] = F[i, i] * P[i, j] * F[j, j] + Q[i, j]
+        else:
+            x = F @ x
+            # fused F P F.T + Q: the rescale and the additive noise are
+            # applied while the single F P temporary is still hot,
+            # instead of materializing a second (dim, dim) product
+            FP = F @ P
+            for i in range(dim):
+                for j in range(dim):
+                    acc = Q[i, j]
+                    for k in range(dim):
+                        acc += FP[i, k] * F[j, k]
+                    P[i, j] = acc
+        R_eff = R.copy()
+        y = np.zeros(num_obs)
+        for i in range(num_obs):
+            if valid[t, i]:
+                y[i] = z[t, i] - H[i] @ x
+            else:
+                R_eff[i, i] += MISSING_OBS_VARIANCE
+        S = H @ P @ H.T + R_eff
+        if 0 < proj_rank < num_obs:
+            # a fresh eigendecomposition per date would cost more than
+            # the full update it replaces; the innovation covariance
+            # changes slowly, so one warm-started subspace iteration
+            # per date keeps the basis current at O(num_obs^2 rank).
+            # the basis is tracked on the uninflated covariance so it
+            # follows the informative directions instead of locking
+            # onto the inflated missing-observation axes
+            S_basis = S.copy()
+            for i in range(num_obs):
+                if not valid[t, i]:
+                    S_basis[i, i] -= MISSING_OBS_VARIANCE
+            if t == 0:
+                _, vecs = np.linalg.eigh(S_basis)
+                E = np.ascontiguousarray(vecs[:, num_obs - proj_rank:])
+            else:
+                q, _ = np.linalg.qr(S_basis @ proj_basis)
+                E = np.ascontiguousarray(q)
+            proj_basis = E
+            # the tracked basis is what warm-starts the next date, but
+            # the update itself must not mix missing readings: a basis
+            # row on a missing axis drags the inflated variance into
+            # the projected innovation and collapses the gain. zero
+            # those rows and re-orthonormalize, so the effective basis
+            # spans live readings only.
+            E_live = E.copy()
+            for i in range(num_obs):
+                if not valid[t, i]:
+                    for j in range(proj_rank):
+                        E_live[i, j] = 0.0
+            q_live, _ = np.linalg.qr(E_live)
+            E_live = np.ascontiguousarray(q_live)
+            H_p = E_live.T @ H
+            K = _solve_spd(E_live.T @ S @ E_live, H_p @ P).T
+            x = x + K @ (E_live.T @ y)
+            P = (eye - K @ H_p) @ P
+        else:
+            K = _solve_spd(S, H @ P).T
+            x = x + K @ y
+            P = (eye - K @ H) @ P
+        # the update leaves P asymmetric at roundoff level; resymmetrize
+        # so the next innovation stays Cholesky-factorable
+        P = 0.5 * (P + P.T)
+        means[t] = x
+        covs[t] = P
+    return means, covs
+
+
+# float32 storage for the state covariance chain; the innovation solve
+# still runs in float64 (see _kf_filter_mixed)
+_KF_MIXED_SIGNATURE = ("Tuple((f4[:, ::1], f4[:, :, ::1]))"
+                       "(f8[:, ::1], b1[:, ::1], f4[:, ::1], f4[:, ::1],"
+                       " f4[:, ::1], f8[:, ::1], f4[::1], f4[:, ::1], i8)")
+
+
+@njit(_KF_MIXED_SIGNATURE, cache=True, fastmath=True)
+def _kf_filter_mixed(z: np.ndarray,
+                     valid: np.ndarray,
+                     H: np.ndarray,
+                     F: np.ndarray,
+                     Q: np.ndarray,
+                     R: np.ndarray,
+                     x0: np.ndarray,
+                     P0: np.ndarray,
+                     proj_rank: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run the Kalman recursion with a float32 state covariance chain.
+
+    The predict step, which is bandwidth bound on the state covariance,
+    runs and stores in float32 so it moves half the bytes of the full
+    precision filter. Each update promotes to float64 before forming
+    and solving the innovation system, where single precision would
+    actually lose accuracy. The diffuse prior is the exception: while
+    the covariance still spans many orders of magnitude, float32
+    storage corrupts its small eigenvalues outright, so the chain is
+    carried in float64 until the transient decays and only then
+    demoted. The posterior uses the Joseph form, which stays positive
+    semidefinite through the float32 round trip where the plain
+    (I - KH)P update does not, plus a diagonal jitter at the
+    observation-noise scale. Arguments and semantics otherwise match
+    _kf_filter.
+
+    Returns
+    -------
+        (filtered means, filtered covariances) across dates, float32.
+    """
+    num_dates, num_obs = z.shape
+    dim = H.shape[1]
+    means = np.zeros((num_dates, dim), dtype=np.float32)
+    covs = np.zeros((num_dates, dim, dim), dtype=np.float32)
+    eye = np.eye(dim)
+    H64 = H.astype(np.float64)
+    F64 = F.astype(np.float64)
+    Q64 = Q.astype(np.float64)
+    x = x0.copy()
+    P = P0.copy()
+    x64 = x0.astype(np.float64)
+    P64 = P0.astype(np.float64)
+    proj_basis = np.zeros((num_obs, proj_rank))
+    max_r = 0.0
+    for i in range(num_obs):
+        if R[i, i] > max_r:
+            max_r = R[i, i]
+    jit = 1e-5 * max_r
+    # float32 cannot hold a covariance whose eigenvalues span more
+    # orders of magnitude than its mantissa; stay in float64 until the
+    # diffuse transient has decayed to within this ratio of the
+    # observation noise
+    demote_below = 1e4 * max_r
+    low_precision = False
+    F_is_diagonal = True
+    for i in range(dim):
+        for j in range(dim):
+            if i != j and F[i, j] != 0.0:
+                F_is_diagonal = False
+    for t in range(num_dates):
+        if low_precision:
+            # bandwidth bound step: predict on the float32 chain
+            if F_is_diagonal:
+                for i in range(dim):
+                    x[i] = F[i, i] * x[i]
+                for i in range(dim):
+                    for j in range(dim):
+                        P[i, j] = F[i, i] * P[i, j] * F[j, j] + Q[i, j]
+            else:
+                x = F @ x
+                FP = F @ P
+                for i in range(dim):
+                    for j in range(dim):
+                        acc = Q[i, j]
+                        for k in range(dim):
+                            acc += FP[i, k] * F[j, k]
+                        P[i, j] = acc
+            # promote for the update; the innovation solve is where
+            # single precision would bite
+            x64 = x.astype(np.float64)
+            P64 = P.astype(np.float64)
+        else:
+            if F_is_diagonal:
+                for i in range(dim):
+                    x64[i] = F64[i, i] * x64[i]
+                for i in range(dim):
+                    for j in range(dim):
+                        P64[i, j] = F64[i, i] * P64[i, j] * F64[j, j] \
+                            + Q64[i, j]
+            else:
+                x64 = F64 @ x64
+                FP = F64 @ P64
+                for i in range(dim):
+                    for j in range(dim):
+                        acc = Q64[i, j]
+                        for k in range(dim):
+                            acc += FP[i, k] * F64[j, k]
+                        P64[i, j] = acc
+        R_eff = R.copy()
+        y = np.zeros(num_obs)
+        for i in range(num_obs):
+            if valid[t, i]:
+                y[i] = z[t, i] - H64[i] @ x64
+            else:
+                R_eff[i, i] += MISSING_OBS_VARIANCE
+        S = H64 @ P64 @ H64.T + R_eff
+        # a jitter at the observation-noise scale absorbs float32
+        # roundoff in S without distorting the posteriors
+        for i in range(num_obs):
+            S[i, i] += jit
+        if 0 < proj_rank < num_obs:
+            # the basis is tracked on the uninflated covariance so it
+            # follows the informative directions instead of locking
+            # onto the inflated missing-observation axes
+            S_basis = S.copy()
+            for i in range(num_obs):
+                if not valid[t, i]:
+                    S_basis[i, i] -= MISSING_OBS_VARIANCE
+            if t == 0:
+                _, vecs = np.linalg.eigh(S_basis)
+                E = np.ascontiguousarray(vecs[:, num_obs - proj_rank:])
+            else:
+                q, _ = np.linalg.qr(S_basis @ proj_basis)
+                E = np.ascontiguousarray(q)
+            proj_basis = E
+            # as in _kf_filter, restrict the effective basis to live
+            # readings before the update so the inflated missing axes
+            # never enter the projected innovation
+            E_live = E.copy()
+            for i in range(num_obs):
+                if not valid[t, i]:
+                    for j in range(proj_rank):
+                        E_live[i, j] = 0.0
+            q_live, _ = np.linalg.qr(E_live)
+            E_live = np.ascontiguousarray(q_live)
+            H_p = E_live.T @ H64
+            K = _solve_spd(E_live.T @ S @ E_live, H_p @ P64).T
+            x64 = x64 + K @ (E_live.T @ y)
+            # Joseph form: a congruence plus a positive semidefinite
+            # term, so the posterior stays factorable after the cast
+            # back to float32 clips its small eigenvalues
+            A = eye - K @ H_p
+            P64 = A @ P64 @ A.T + K @ (E_live.T @ R_eff @ E_live) @ K.T
+        else:
+            K = _solve_spd(S, H64 @ P64).T
+            x64 = x64 + K @ y
+            A = eye - K @ H64
+            P64 = A @ P64 @ A.T + K @ R_eff @ K.T
+        P64 = 0.5 * (P64 + P64.T)
+        if not low_precision:
+            max_p = 0.0
+            for i in range(dim):
+                if P64[i, i] > max_p:
+                    max_p = P64[i, i]
+            low_precision = max_p < demote_below
+        if low_precision:
+            x = x64.astype(np.float32)
+            P = P64.astype(np.float32)
+        means[t] = x64.astype(np.float32)
+        covs[t] = P64.astype(np.float32)
+    return means, covs
+
 
 def nowcast(input_dates: List[int],
             input_location: List[Tuple[str, str]],
@@ -11,8 +387,20 @@ def nowcast(input_dates: List[int],
             ground_truth_indicator: Tuple[str, str],
             kernel: List[float],
             nowcast_dates: List[int] = "*",
+            geos: Tuple = None,
+            populations: Dict[str, float] = None,
+            process_noise: float = None,
+            projection_rank: int = 0,
+            precision: str = "double",
             ) -> Tuple[np.ndarray, np.ndarray, List]:
     """
+    Nowcast the ground truth signal by fusing sensors per location.
+
+    The pipeline deconvolves the indicator into a ground truth
+    estimate, fits AR and regression sensors on it, reduces the
+    sensor-location structure to a full rank statespace, estimates the
+    sensor noise covariance, and runs a random walk Kalman filter over
+    the input dates in one compiled recursion.
 
     Parameters
     ----------
@@ -28,18 +416,110 @@ def nowcast(input_dates: List[int],
         Delay distribution to deconvolv with ground_truth_indicator
     nowcast_dates
         Dates to get predictions for. Defaults to input_dates + additional day.
+    geos
+        Tuple of (county list, msa-county mapping, state-county
+        mapping), e.g. from statespace.load_geos.
+    populations
+        Dict of county FIPS to population; counties are weighted
+        equally if not given.
+    process_noise
+        Variance of the random walk state transition; estimated from
+        the day-over-day changes in the ground truth if not given.
+    projection_rank
+        If positive, project each innovation onto this many top
+        eigenvector directions of its covariance, trading a little
+        accuracy for a much smaller per-date solve when the number of
+        sensor readings is large.
+    precision
+        "double" (default) or "mixed". Mixed stores the state
+        covariance chain in float32, halving the bandwidth of the
+        predict step, while still solving each innovation in float64.
 
     Returns
     -------
-        (predicted values, std devs, locations)
+        (predicted values, std devs, locations), with one row per
+        nowcast date.
     """
+    kernel = np.ascontiguousarray(kernel, dtype=np.float64)
+    input_dates = sorted(input_dates)
+    if nowcast_dates == "*":
+        nowcast_dates = input_dates + [lag_date(input_dates[-1], -1)]
     # get geo mappings
+    if geos is None:
+        geos = ([geo_value for geo_value, geo_type in input_location
+                 if geo_type == "county"], {}, {})
     # deconvolve for ground truth
+    truth = deconv_signal(ground_truth_indicator, input_dates,
+                          input_location, kernel)
+    ground_truths = [LocationSeries(geo_value, geo_type, list(input_dates),
+                                    truth[i].tolist())
+                     for i, (geo_value, geo_type) in enumerate(input_location)]
     # fit sensors
+    sensors = generate_sensors(input_dates, sensor_indicators, ground_truths)
     # generate statespace
+    W, H, output_locations = generate_statespace(sensors, input_location,
+                                                 geos, populations)
+    # align sensor readings and their location's truth on the input dates
+    series_list = [series for series_list in sensors.values()
+                   for series in series_list]
+    date_index = {date: i for i, date in enumerate(input_dates)}
+    dates_arr = np.asarray(input_dates, dtype=np.int64)
+    truth_by_loc = {location: truth[i]
+                    for i, location in enumerate(input_location)}
+    z = np.zeros((len(input_dates), len(series_list)))
+    obs_valid = np.zeros(z.shape, dtype=np.bool_)
+    truth_rows = np.zeros((len(series_list), len(input_dates)))
+    for j, series in enumerate(series_list):
+        loc_truth = truth_by_loc.get((series.geo_value, series.geo_type))
+        if loc_truth is not None:
+            truth_rows[j] = loc_truth
+        # align the series on the input dates with one searchsorted over
+        # the int64 date arrays instead of a dict probe per observation
+        rows = np.searchsorted(dates_arr, series.dates)
+        rows_clipped = np.minimum(rows, dates_arr.size - 1)
+        keep = ((dates_arr[rows_clipped] == series.dates)
+                & ~np.isnan(series.values))
+        z[rows_clipped[keep], j] = series.values[keep]
+        obs_valid[rows_clipped[keep], j] = True
     # estimate covariance
+    R = estimate_covariance(input_dates, series_list, truth_rows)
     # run SF
-    # return output
-    pass
-
-
+    dim = H.shape[1]
+    if process_noise is None:
+        process_noise = float(np.nanmean(np.nanvar(np.diff(truth, axis=1),
+                                                   axis=1)))
+    if precision == "mixed":
+        means, covs = _kf_filter_mixed(
+            z, obs_valid, H.astype(np.float32),
+            np.eye(dim, dtype=np.float32),
+            (process_noise * np.eye(dim)).astype(np.float32), R,
+            np.zeros(dim, dtype=np.float32),
+            (MISSING_OBS_VARIANCE * np.eye(dim)).astype(np.float32),
+            projection_rank)
+        means = means.astype(np.float64)
+        covs = covs.astype(np.float64)
+    elif precision == "double":
+        means, covs = _kf_filter(z, obs_valid, H, np.eye(dim),
+                                 process_noise * np.eye(dim), R,
+                                 np.zeros(dim),
+                                 MISSING_OBS_VARIANCE * np.eye(dim),
+                                 projection_rank)
+    else:
+        raise ValueError(f"unknown precision {precision!r}")
+    predictions = np.full((len(nowcast_dates), W.shape[0]), np.nan)
+    stdevs = np.full(predictions.shape, np.nan)
+    next_day = lag_date(input_dates[-1], -1)
+    for k, day in enumerate(nowcast_dates):
+        idx = date_index.get(day)
+        if idx is not None:
+            mean, cov = means[idx], covs[idx]
+        elif day == next_day:
+            # one more predict step past the data
+            mean = means[-1]
+            cov = covs[-1] + process_noise * np.eye(dim)
+        else:
+            print(f"no nowcast available for {day}")
+            continue
+        predictions[k] = W @ mean
+        stdevs[k] = np.sqrt(np.einsum("ij,jk,ik->i", W, cov, W))
+    return predictions, stdevs, output_locations
@@ -1,43 +1,518 @@
-"""Estimate the covariance matrix."""
+"""Generate sensors from indicators and ground truth."""
 
-from typing import List, Tuple
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from math import isnan
+from typing import Dict, List, Tuple
 
-def generate_sensors(input_dates: List[int],
-                     input_location: List[Tuple[str, str]],
-                     sensor_indicators: List[Tuple[str, str]],
-                     ) -> List[Tuple]:
+import numpy as np
+from pandas import DataFrame
+
+from .epidata import (LocationSeries, get_historical_sensor_data,
+                      get_indicator_data, get_indicator_version_data)
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; fall back to the plain function
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+    prange = range
+
+# key under which the autoregressive sensor on the ground truth is stored
+AR_SENSOR_KEY = "ground_truth_ar"
+
+
+def compute_regression_sensor(day: int,
+                              covariate: LocationSeries,
+                              response: LocationSeries,
+                              include_intercept: bool = False) -> float:
+    """
+    Fit a regression of the response on an indicator and predict a day.
+
+    The fit uses all days strictly before the target day. The
+    no-intercept case reduces the normal equations to a scalar divide;
+    with an intercept the 2x2 system is solved directly rather than
+    going through an explicit matrix inverse.
+
+    Parameters
+    ----------
+    day
+        Date to predict, as a YYYYMMDD int.
+    covariate
+        LocationSeries of indicator values to regress on.
+    response
+        LocationSeries of ground truth values.
+    include_intercept
+        Whether to include an intercept in the regression.
+
+    Returns
+    -------
+        Sensor value for the day, or NaN if no fit was possible.
+    """
+    covariate_map = dict(zip(covariate.dates, covariate.values))
+    date_val = covariate_map.get(day, np.nan)
+    if isnan(date_val):
+        return np.nan
+    train_Y = []
+    train_covariates = []
+    for date, value in zip(response.dates, response.values):
+        if date >= day:
+            continue
+        covariate_val = covariate_map.get(date)
+        if covariate_val is not None:
+            train_covariates.append(covariate_val)
+            train_Y.append(value)
+    train_Y = np.asarray(train_Y, dtype=np.float64)
+    train_covariates = np.asarray(train_covariates, dtype=np.float64)
+    mask = ~(np.isnan(train_Y) | np.isnan(train_covariates))
+    train_Y = train_Y[mask]
+    train_covariates = train_covariates[mask]
+    if train_Y.shape[0] == 0:
+        return np.nan
+    if include_intercept:
+        X = np.column_stack((np.ones_like(train_covariates),
+                             train_covariates))
+        B = np.linalg.solve(X.T @ X, X.T @ train_Y)
+        return B[0] + date_val * B[1]
+    denominator = train_covariates @ train_covariates
+    if denominator == 0:
+        return np.nan
+    return date_val * (train_covariates @ train_Y) / denominator
+
+
+def compute_ar_sensor(day: int,
+                      values: LocationSeries,
+                      ar_size: int = 3,
+                      lambda_: float = 0.1) -> float:
+    """
+    Fit an AR model on past values and predict the given day.
+
+    Delegates to the compiled batch solver with a single target day,
+    so one-off calls share its accumulated-normal-equations code path
+    (and its compile cache) instead of building a lag design matrix.
+
+    Parameters
+    ----------
+    day
+        Date to predict, as a YYYYMMDD int.
+    values
+        LocationSeries of past values to fit on.
+    ar_size
+        Number of autoregressive lags.
+    lambda_
+        Ridge penalty used to keep the small system well conditioned.
+
+    Returns
+    -------
+        Sensor value for the day, or NaN if no fit was possible.
+    """
+    dates = np.asarray(values.dates)
+    vals = np.asarray(values.values, dtype=np.float64)
+    end = np.searchsorted(dates, day)
+    return float(_ar_fit_batch(vals, np.array([end]), ar_size, lambda_)[0])
+
+
+@njit(parallel=True, cache=True)
+def _ar_fit_batch(vals: np.ndarray,
+                  ends: np.ndarray,
+                  ar_size: int,
+                  lambda_: float) -> np.ndarray:
+    """
+    Fit the per-day AR models for a whole date range in one call.
+
+    The normal equations for each day are accumulated directly from
+    the value array, with the days handled in parallel, instead of
+    rebuilding a lag design matrix per day at the Python level.
+
+    Parameters
+    ----------
+    vals
+        Full array of past values for the location.
+    ends
+        Number of values strictly before each target day.
+    ar_size
+        Number of autoregressive lags.
+    lambda_
+        Ridge penalty used to keep the small system well conditioned.
+
+    Returns
+    -------
+        Predicted value per target day, NaN where no fit was possible.
     """
+    out = np.full(ends.shape[0], np.nan)
+    for i in prange(ends.shape[0]):
+        end = ends[i]
+        num_obs = end - ar_size
+        if num_obs < 2 * ar_size:
+            continue
+        ok = True
+        for t in range(end):
+            if vals[t] != vals[t]:
+                ok = False
+                break
+        if not ok:
+            continue
+        XtX = np.zeros((ar_size, ar_size))
+        XtY = np.zeros(ar_size)
+        for a in range(ar_size):
+            XtX[a, a] = lambda_
+            for t in range(num_obs):
+                XtY[a] += vals[t + a] * vals[t + ar_size]
+                for b in range(a, ar_size):
+                    XtX[a, b] += vals[t + a] * vals[t + b]
+            for b in range(a):
+                XtX[a, b] = XtX[b, a]
+        B = np.linalg.solve(XtX, XtY)
+        pred = 0.0
+        for a in range(ar_size):
+            pred += vals[end - ar_size + a] * B[a]
+        out[i] = pred
+    return out
+
+
+def get_ar_sensor(values: LocationSeries,
+                  input_dates: List[int],
+                  ar_size: int = 3,
+                  lambda_: float = 0.1) -> LocationSeries:
+    """
+    Compute the autoregressive sensor for one location.
+
+    All days are fit in one batched kernel call rather than refitting
+    through a per-day Python loop over compute_ar_sensor.
 
     Parameters
     ----------
+    values
+        LocationSeries of ground truth values for the location.
     input_dates
-        List of dates to train data on and get nowcasts for.
-    input_location
-        List of (location, geo_type) tuples specifying locations to train and obtain nowcasts for.
+        Dates to compute sensor values for.
+    ar_size
+        Number of autoregressive lags.
+    lambda_
+        Ridge penalty used to keep the small system well conditioned.
+
+    Returns
+    -------
+        LocationSeries of sensor values on the dates a fit was possible.
+    """
+    days = np.asarray(input_dates)
+    predictions = _ar_fit_batch(values.values,
+                                np.searchsorted(values.dates, days),
+                                ar_size, lambda_)
+    mask = ~np.isnan(predictions)
+    return LocationSeries(values.geo_value, values.geo_type,
+                          days[mask], predictions[mask])
+
+
+@njit(cache=True)
+def _regression_batch(resp_vals: np.ndarray,
+                      cov_at_resp: np.ndarray,
+                      target_ends: np.ndarray,
+                      target_covs: np.ndarray) -> np.ndarray:
+    """
+    Fit the per-day no-intercept regressions for all days in one call.
+
+    Because the training window for a day is everything strictly
+    before it, the normal equations are running sums: one prefix pass
+    accumulates them and each day's fit becomes a constant-time
+    lookup, rather than re-running the OLS from scratch per day.
+
+    Parameters
+    ----------
+    resp_vals
+        Ground truth values in date order.
+    cov_at_resp
+        Covariate value on each ground truth date, NaN where missing.
+    target_ends
+        Number of ground truth dates strictly before each target day.
+    target_covs
+        Covariate value on each target day, NaN where missing.
+
+    Returns
+    -------
+        Sensor value per target day, NaN where no fit was possible.
+    """
+    n = resp_vals.shape[0]
+    sxx = np.zeros(n + 1)
+    sxy = np.zeros(n + 1)
+    for t in range(n):
+        x = cov_at_resp[t]
+        y = resp_vals[t]
+        sxx[t + 1] = sxx[t]
+        sxy[t + 1] = sxy[t]
+        if x == x and y == y:
+            sxx[t + 1] += x * x
+            sxy[t + 1] += x * y
+    out = np.full(target_ends.shape[0], np.nan)
+    for i in range(target_ends.shape[0]):
+        x0 = target_covs[i]
+        end = target_ends[i]
+        if x0 == x0 and sxx[end] > 0.0:
+            out[i] = x0 * sxy[end] / sxx[end]
+    return out
+
+
+def get_indicator_sensor(ground_truth: LocationSeries,
+                         historical: Tuple[LocationSeries, List[int]],
+                         covariate: LocationSeries) -> LocationSeries:
+    """
+    Compute the regression sensor of an indicator for one location.
+
+    Previously computed values come from the batched historical fetch
+    and only the missing dates are fit.
+
+    Parameters
+    ----------
+    ground_truth
+        LocationSeries of ground truth values for the location.
+    historical
+        (LocationSeries of stored sensor values, missing dates) from
+        get_historical_sensor_data.
+    covariate
+        LocationSeries of indicator values to regress on.
+
+    Returns
+    -------
+        LocationSeries of sensor values on the dates a fit was possible.
+    """
+    output, missing_dates = historical
+    if not missing_dates:
+        return output
+    covariate_map = dict(zip(covariate.dates, covariate.values))
+    days = np.asarray(missing_dates)
+    fits = _regression_batch(
+        ground_truth.values,
+        np.array([covariate_map.get(date, np.nan)
+                  for date in ground_truth.dates.tolist()]),
+        np.searchsorted(ground_truth.dates, days),
+        np.array([covariate_map.get(day, np.nan) for day in missing_dates]))
+    mask = ~np.isnan(fits)
+    output.dates = np.concatenate((output.dates, days[mask]))
+    output.values = np.concatenate((output.values, fits[mask]))
+    return output
+
+
+def get_indicator_sensor_as_of(indicator: Tuple[str, str],
+                               ground_truth: LocationSeries,
+                               historical: Tuple[LocationSeries, List[int]]
+                               ) -> LocationSeries:
+    """
+    Compute regression sensor values on as-of views of an indicator.
+
+    Every issued version of the indicator is pulled in one query and
+    replayed chronologically, so each missing day is fit against the
+    data as it looked on that day without a per-day as_of round trip.
+
+    Parameters
+    ----------
+    indicator
+        (source, signal) tuple specifying the indicator.
+    ground_truth
+        LocationSeries of ground truth values for the location.
+    historical
+        (LocationSeries of stored sensor values, missing dates) from
+        get_historical_sensor_data.
+
+    Returns
+    -------
+        LocationSeries of sensor values on the dates a fit was possible.
+    """
+    output, missing_dates = historical
+    if not missing_dates:
+        return output
+    rows = get_indicator_version_data(indicator, ground_truth.geo_type,
+                                      ground_truth.geo_value,
+                                      max(missing_dates))
+    view = {}
+    row_idx = 0
+    days = np.asarray(sorted(missing_dates))
+    fits = np.full(days.shape[0], np.nan)
+    for i, day in enumerate(days.tolist()):
+        # roll the view forward to everything issued by this day
+        while row_idx < len(rows) and rows[row_idx]["issue"] <= day:
+            value = rows[row_idx]["value"]
+            if value == value:  # inline NaN check
+                view[rows[row_idx]["time_value"]] = value
+            row_idx += 1
+        if not view:
+            continue
+        dates = sorted(view)
+        covariate = LocationSeries(ground_truth.geo_value,
+                                   ground_truth.geo_type,
+                                   dates, [view[date] for date in dates])
+        fits[i] = compute_regression_sensor(day, covariate, ground_truth)
+    mask = ~np.isnan(fits)
+    output.dates = np.concatenate((output.dates, days[mask]))
+    output.values = np.concatenate((output.values, fits[mask]))
+    return output
+
+
+def export_to_csv(sensors: Dict[Tuple, List[LocationSeries]],
+                  receiving_dir: str) -> List[str]:
+    """
+    Write computed sensor values to CSV in the receiving format.
+
+    Rows are grouped by output file in one pass, then each file is
+    written with a single bulk to_csv call through pandas' C writer,
+    rather than paying a makedirs/open/format round per value.
+
+    Parameters
+    ----------
+    sensors
+        Dict of sensor key to list of LocationSeries, as returned by
+        generate_sensors.
+    receiving_dir
+        Directory to write the files under.
+
+    Returns
+    -------
+        List of paths written.
+    """
+    rows = defaultdict(lambda: ([], []))
+    for sensor_key, series_list in sensors.items():
+        if isinstance(sensor_key, tuple):
+            source, signal = sensor_key
+        else:
+            source, signal = "ground_truth", sensor_key
+        for series in series_list:
+            for date, value in zip(series.dates.tolist(),
+                                   series.values.tolist()):
+                path = os.path.join(receiving_dir, source,
+                                    f"{date}_{series.geo_type}_{signal}.csv")
+                geo_values, values = rows[path]
+                geo_values.append(series.geo_value)
+                values.append(value)
+    for directory in {os.path.dirname(path) for path in rows}:
+        os.makedirs(directory, exist_ok=True)
+    for path, (geo_values, values) in rows.items():
+        # one bulk write per file through pandas' C csv writer
+        header = not os.path.exists(path)
+        DataFrame({"geo_value": geo_values, "value": values}).to_csv(
+            path, index=False, mode="a", header=header)
+    return list(rows)
+
+
+def _compute_location_sensors(ground_truth: LocationSeries,
+                              input_dates: List[int],
+                              sensor_indicators: List[Tuple[str, str]],
+                              indicator_data: Dict[Tuple, LocationSeries],
+                              historical_data: Dict[Tuple, Tuple]
+                              ) -> List[Tuple]:
+    """
+    Compute all sensors for one location.
+
+    Top-level (rather than a closure) so it pickles cleanly into
+    worker processes.
+
+    Parameters
+    ----------
+    ground_truth
+        LocationSeries of ground truth values for the location.
+    input_dates
+        Dates to compute sensor values for.
     sensor_indicators
-        List of (source, signal) tuples specifying indicators to use as sensors.
+        List of (source, signal) tuples specifying indicators to use.
+    indicator_data
+        Dict of (source, signal) to dict of (geo_type, geo_value) to
+        LocationSeries.
+    historical_data
+        Dict of (source, signal) to dict of (geo_type, geo_value) to
+        the (stored values, missing dates) pair for that sensor.
 
     Returns
     -------
-        TBD
+        List of (sensor id, LocationSeries) pairs for this location,
+        where id 0 is the AR sensor and id i+1 is sensor_indicators[i].
+        Integer ids keep the cross-process accumulation to a list index
+        per result instead of hashing a tuple key.
     """
-    # api_sensors = []
-    # ar_sensors = []
-    # for each location:
-    #     ar_sensors.append(get_ar_sensor(location, values, ...))
-    #     for each indicator:
-    #         sensors.append(get_indicator_sensor(location, indicator, input_dates)
-    # return api_sensors + ar_sensors
-    pass
+    results = []
+    ar_sensor = get_ar_sensor(ground_truth, input_dates)
+    if ar_sensor.dates.size:
+        results.append((0, ar_sensor))
+    loc_key = (ground_truth.geo_type, ground_truth.geo_value)
+    for i, indicator in enumerate(sensor_indicators):
+        covariate_bucket = indicator_data.get(indicator)
+        if covariate_bucket is None:
+            continue
+        covariate = covariate_bucket.get(loc_key)
+        if covariate is None:
+            continue
+        sensor = get_indicator_sensor(ground_truth,
+                                      historical_data[indicator][loc_key],
+                                      covariate)
+        if sensor.dates.size:
+            results.append((i + 1, sensor))
+    return results
 
 
-def get_ar_sensor():
-    # get existing sensor values from DB
-    # for dates that arent available (hopefully just today), grab necessary window of indicator values
-    # return sensor values up to and including today (current sensor value)
-    pass
+def generate_sensors(input_dates: List[int],
+                     sensor_indicators: List[Tuple[str, str]],
+                     ground_truths: List[LocationSeries]
+                     ) -> Dict[Tuple, List[LocationSeries]]:
+    """
+    Compute AR and regression sensors for every location.
 
+    Each location is an independent work unit, so after the shared
+    indicator fetch the per-location computation is fanned out across
+    worker processes.
+
+    Parameters
+    ----------
+    input_dates
+        List of dates to train data on and get nowcasts for.
+    sensor_indicators
+        List of (source, signal) tuples specifying indicators to use as sensors.
+    ground_truths
+        List of LocationSeries of ground truth values, one per location.
 
-def get_indicator_sensor():
-    # same as ar_sensor but with different signals
-    pass
\ No newline at end of file
+    Returns
+    -------
+        Dict of sensor key to list of LocationSeries across locations.
+        The AR sensor on the ground truth is keyed by AR_SENSOR_KEY and
+        regression sensors by their (source, signal) tuple.
+    """
+    indicator_data = get_indicator_data(sensor_indicators, ground_truths,
+                                        max(input_dates))
+    # indicators with no data anywhere can be dropped before the
+    # historical fetch and the worker fan-out
+    available_indicators = [indicator for indicator in sensor_indicators
+                            if indicator in indicator_data]
+    if len(available_indicators) < len(sensor_indicators):
+        print(f"no data for sensors "
+              f"{sorted(set(sensor_indicators) - indicator_data.keys())}")
+    # one batched historical query per (sensor, geo type) rather than one
+    # round trip per (sensor, location)
+    locations_by_type = defaultdict(list)
+    for ground_truth in ground_truths:
+        locations_by_type[ground_truth.geo_type].append(ground_truth.geo_value)
+    historical_data = defaultdict(dict)
+    for indicator in available_indicators:
+        for geo_type, geo_values in locations_by_type.items():
+            batch = get_historical_sensor_data(indicator, geo_type, geo_values,
+                                               min(input_dates),
+                                               max(input_dates))
+            for geo_value, historical in batch.items():
+                historical_data[indicator][(geo_type, geo_value)] = historical
+    # results come back tagged with integer sensor ids, so accumulation
+    # is a list index per series; the dict shape is rebuilt once at the
+    # end for callers
+    slots = [[] for _ in range(len(available_indicators) + 1)]
+    with ProcessPoolExecutor() as executor:
+        all_results = executor.map(
+            partial(_compute_location_sensors,
+                    input_dates=input_dates,
+                    sensor_indicators=available_indicators,
+                    indicator_data=indicator_data,
+                    historical_data=historical_data),
+            ground_truths)
+        for location_results in all_results:
+            for sensor_id, series in location_results:
+                slots[sensor_id].append(series)
+    keys = [AR_SENSOR_KEY] + available_indicators
+    return {key: series_list
+            for key, series_list in zip(keys, slots) if series_list}
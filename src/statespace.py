@@ -1,73 +1,301 @@
-"""Estimate the covariance matrix."""
+"""Generate the fusion statespace."""
 
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
 
 import numpy as np
+import pandas as pd
 
+from .epidata import LocationSeries
 
-def generate_statespace(sensors: List[Tuple],
-                        input_locations: List[Tuple],
-                        geos: Tuple
-                        ) -> Tuple[np.ndarray, np.ndarray, List]:
+
+@lru_cache(maxsize=None)
+def load_geos(fips_pop_csv: str,
+              fips_msa_csv: str,
+              fips_state_csv: str) -> Tuple[Tuple, Dict[str, float]]:
     """
-    Generate W and H matrices.
+    Load the county population, msa, and state mapping tables.
+
+    The tables are identical across generate_statespace calls, so the
+    parsed mappings are memoized on the file paths instead of being
+    re-read and re-grouped per call. Only the needed columns are
+    parsed, with explicit dtypes.
+
+    Parameters
+    ----------
+    fips_pop_csv
+        Path to the county population table, with fips and population
+        columns.
+    fips_msa_csv
+        Path to the county-msa table, with fips and msa columns.
+    fips_state_csv
+        Path to the county-state table, with fips and state_id columns.
+
+    Returns
+    -------
+        ((county list, msa-county mapping, state-county mapping),
+         dict of county FIPS to population), as consumed by
+        generate_statespace.
+    """
+    pop = pd.read_csv(fips_pop_csv, usecols=["fips", "population"],
+                      dtype={"fips": str, "population": np.float64})
+    msa = pd.read_csv(fips_msa_csv, usecols=["fips", "msa"], dtype=str)
+    state = pd.read_csv(fips_state_csv, usecols=["fips", "state_id"],
+                        dtype=str)
+    msa_map = {m: group.tolist() for m, group in msa.groupby("msa")["fips"]}
+    state_map = {s: group.tolist()
+                 for s, group in state.groupby("state_id")["fips"]}
+    geos = (pop["fips"].tolist(), msa_map, state_map)
+    return geos, dict(zip(pop["fips"], pop["population"]))
+
+
+def _member_indices(geos: Tuple) -> Dict[Tuple[str, str], np.ndarray]:
+    """
+    Map every location to the indices of its atoms, computed once.
+
+    Membership previously meant a scan over the full atom array per
+    weight row; here each msa/state county list is converted to an
+    index array a single time, so building a row is a direct fancy
+    index instead of repeated membership tests.
 
     Parameters
     ----------
-    sensors
-        TBD exactly, but contains sensors values and dates
-    input_locations
-        Locations to train and predict nowcasts for.
     geos
         Tuple of (county list, msa-county mapping, state-county mapping).
 
     Returns
     -------
-        Full rank matrices W and H
+        Dict of (geo_value, geo_type) to array of atom indices.
     """
-    # num_sensors = len(sensors)
-    # num_locs = len(geos[0])
-    # W0 = generate_W0(geos, num_sensors)
-    # H0 = generate_H0(geos, num_locs)
-    # return determine_statespace(W0, H0)
-    pass
+    atoms, msa_map, state_map = geos
+    atom_index = {atom: i for i, atom in enumerate(atoms)}
+    members = {(atom, "county"): np.array([i], dtype=np.intp)
+               for atom, i in atom_index.items()}
+    for mapping, geo_type in ((msa_map, "msa"), (state_map, "state")):
+        for location, counties in mapping.items():
+            members[(location, geo_type)] = np.fromiter(
+                (atom_index[county] for county in counties
+                 if county in atom_index), dtype=np.intp)
+    return members
 
 
-def generate_H0(geos: Tuple,
-                num_sensors: int) -> np.ndarray:
+def _weight_matrix(locations: List[Tuple[str, str]],
+                   num_atoms: int,
+                   atom_pop: np.ndarray,
+                   member_idx: Dict[Tuple[str, str], np.ndarray]
+                   ) -> np.ndarray:
+    """
+    Build the population-weighted county membership matrix at once.
+
+    Rows are filled from the precomputed index arrays, then weighted
+    and row-normalized in two batched operations instead of one row
+    at a time. Single-atom rows are one-hot by construction and skip
+    the weighting entirely.
+
+    Parameters
+    ----------
+    locations
+        (geo_value, geo_type) of each row to build.
+    num_atoms
+        Number of counties spanning the statespace.
+    atom_pop
+        Population of each atom, aligned with the county list.
+    member_idx
+        Precomputed atom indices from _member_indices.
+
+    Returns
+    -------
+        Matrix with one row of atom weights per location, each summing
+        to 1, or all zeros for a location containing no atoms.
+    """
+    weighted = np.zeros((len(locations), num_atoms))
+    multi_rows = []
+    for i, location in enumerate(locations):
+        idx = member_idx.get(location)
+        if idx is None or idx.shape[0] == 0:
+            continue
+        if idx.shape[0] == 1:
+            # single-atom locations (counties) are one-hot rows, so the
+            # weighting and normalization would be a no-op
+            weighted[i, idx[0]] = 1.0
+        else:
+            weighted[i, idx] = atom_pop[idx]
+            multi_rows.append(i)
+    if multi_rows:
+        rows = weighted[multi_rows]
+        totals = rows.sum(axis=1, keepdims=True)
+        np.divide(rows, totals, out=rows, where=totals > 0)
+        weighted[multi_rows] = rows
+    return weighted
+
+
+def generate_H0(sensor_locations: List[Tuple[str, str]],
+                geos: Tuple,
+                atom_pop: np.ndarray,
+                member_idx: Dict[Tuple[str, str], np.ndarray] = None
+                ) -> np.ndarray:
     """
     Build matrix of all available sensor-location pairs.
 
     Parameters
     ----------
+    sensor_locations
+        (geo_value, geo_type) of each sensor reading being fused.
     geos
         Tuple of (county list, msa-county mapping, state-county mapping).
-    num_sensors
-        Number of sensors being fused.
+    atom_pop
+        Population of each county, aligned with the county list.
+    member_idx
+        Precomputed atom indices from _member_indices, e.g. shared
+        with the W0 construction; computed here if not given.
 
     Returns
     -------
-        Matrix of dimension # nowcasts X # counties. Usually rank deficient.
+        Matrix of dimension # sensors X # counties. Usually rank deficient.
     """
-    # Wrap this code https://github.com/dfarrow0/covidcast-nowcast/blob/0de33880368eac3df6c1ac7b2d4ba6a41ff85480/src/sf/nowcast.py#L176-L192
-    pass
+    if member_idx is None:
+        member_idx = _member_indices(geos)
+    return _weight_matrix(sensor_locations, len(geos[0]), atom_pop,
+                          member_idx)
 
 
-def generate_W0(geos: Tuple,
-                num_locations: int) -> np.ndarray:
+def generate_W0(output_locations: List[Tuple[str, str]],
+                geos: Tuple,
+                atom_pop: np.ndarray,
+                member_idx: Dict[Tuple[str, str], np.ndarray] = None
+                ) -> np.ndarray:
     """
     Build matrix determining all locations we want a nowcast.
 
     Parameters
     ----------
+    output_locations
+        (geo_value, geo_type) of each location to nowcast.
     geos
         Tuple of (county list, msa-county mapping, state-county mapping).
-    num_locations
-        Number of locations, which are counties in our case.
+    atom_pop
+        Population of each county, aligned with the county list.
+    member_idx
+        Precomputed atom indices from _member_indices, e.g. shared
+        with the H0 construction; computed here if not given.
 
     Returns
     -------
-        Matrix of dimension # sensors X # counties. Usually rank deficient.
+        Matrix of dimension # nowcasts X # counties. Usually rank deficient.
+    """
+    if member_idx is None:
+        member_idx = _member_indices(geos)
+    return _weight_matrix(output_locations, len(geos[0]), atom_pop,
+                          member_idx)
+
+
+def determine_statespace(W0: np.ndarray,
+                         H0: np.ndarray,
+                         tol: float = 1e-8
+                         ) -> Tuple[np.ndarray, np.ndarray, List[int]]:
+    """
+    Reduce W0 and H0 to a full rank statespace.
+
+    The statespace is the row space of H0; sensors determine a state
+    only up to that subspace, so H is re-expressed on an orthonormal
+    basis of it and output rows that leave the subspace are dropped as
+    unresolvable.
+
+    Parameters
+    ----------
+    W0
+        Output weight matrix, # nowcasts X # counties.
+    H0
+        Sensor weight matrix, # sensors X # counties.
+    tol
+        Relative singular value cutoff for the rank of H0.
+
+    Returns
+    -------
+        (W, H, indices of W0 rows kept), with H full column rank.
+    """
+    _, s, Vt = np.linalg.svd(H0, full_matrices=False)
+    rank = int(np.sum(s > tol * s[0])) if s.shape[0] else 0
+    basis = Vt[:rank]
+    H = H0 @ basis.T
+    residual = W0 - (W0 @ basis.T) @ basis
+    kept = np.where(np.abs(residual).max(axis=1) <= tol)[0]
+    W = W0[kept] @ basis.T
+    return W, H, kept.tolist()
+
+
+def generate_statespace(sensors: Dict[Tuple, List[LocationSeries]],
+                        input_locations: List[Tuple[str, str]],
+                        geos: Tuple,
+                        populations: Dict[str, float] = None
+                        ) -> Tuple[np.ndarray, np.ndarray, List]:
+    """
+    Generate W and H matrices.
+
+    Parameters
+    ----------
+    sensors
+        Dict of sensor key to list of LocationSeries, as returned by
+        generate_sensors.
+    input_locations
+        (geo_value, geo_type) of each location to nowcast.
+    geos
+        Tuple of (county list, msa-county mapping, state-county mapping).
+    populations
+        Dict of county FIPS to population; counties are weighted
+        equally if not given.
+
+    Returns
+    -------
+        (W, H, locations nowcast), with W and H full column rank and
+        the locations the subset of input_locations that the available
+        sensors can resolve.
+    """
+    atoms = geos[0]
+    if populations is None:
+        atom_pop = np.ones(len(atoms))
+    else:
+        atom_pop = np.array([populations[atom] for atom in atoms],
+                            dtype=np.float64)
+    sensor_locations = [(series.geo_value, series.geo_type)
+                        for series_list in sensors.values()
+                        for series in series_list]
+    # membership index arrays are shared by the H0 and W0 builds
+    member_idx = _member_indices(geos)
+    H0 = generate_H0(sensor_locations, geos, atom_pop, member_idx)
+    W0 = generate_W0(input_locations, geos, atom_pop, member_idx)
+    W, H, kept = determine_statespace(W0, H0)
+    return W, H, [input_locations[i] for i in kept]
+
+
+def _generate_statespace_task(task: Tuple) -> Tuple:
+    """Unpack one generate_statespace argument tuple for a worker.
+
+    Top-level (rather than a closure) so it pickles cleanly into
+    worker processes.
+    """
+    return generate_statespace(*task)
+
+
+def generate_statespace_many(tasks: Iterable[Tuple]) -> List[Tuple]:
+    """
+    Generate statespaces for many independent inputs in parallel.
+
+    Each build is CPU-heavy through the rank reduction and shares
+    nothing with the others, so e.g. per-state invocations are fanned
+    out across worker processes like the per-location fits elsewhere
+    in the pipeline.
+
+    Parameters
+    ----------
+    tasks
+        Iterable of (sensors, input_locations, geos, populations)
+        argument tuples for generate_statespace.
+
+    Returns
+    -------
+        List of generate_statespace results in task order.
     """
-    # Wrap this code https://github.com/dfarrow0/covidcast-nowcast/blob/0de33880368eac3df6c1ac7b2d4ba6a41ff85480/src/sf/nowcast.py#L200-L215
-    pass
+    with ProcessPoolExecutor() as executor:
+        return list(executor.map(_generate_statespace_task, tasks))